@@ -0,0 +1,666 @@
+"""
+analytics.py
+------------
+Motor de analítica vectorizada sobre una instantánea columnar de los votos.
+
+Las consultas cruzadas (votos por candidato × dominio de correo,
+participación por dominio, histogramas) son lentas en SQLite fila a fila
+cuando la elección es grande. Este módulo mantiene una copia columnar de los
+datos en ficheros mapeados en memoria (numpy.memmap) dentro de
+databases/analytics/ y calcula las agregaciones con NumPy (bincount,
+histogram), sin recorrer filas en Python.
+
+Columnas:
+- votes_vote_id (int64), votes_voter_id (int64), votes_candidate_id (int32),
+  votes_domain (int32): un registro por voto.
+- voters_voter_id (int64), voters_domain (int32): un registro por votante.
+- deleted_voter_id (int64), deleted_domain (int32): un registro por votante
+  eliminado que ya estaba en la instantánea.
+- Los dominios de correo se guardan codificados como enteros; el diccionario
+  de códigos está en meta.json junto al número de filas válidas, el último
+  id leído de cada tabla y la identidad del fichero de la base (dispositivo
+  e inodo).
+
+Actualización incremental:
+- refresh() solo lee de la base de datos las filas con id mayor que el último
+  id importado (votes.id y voters.id) y las añade al final de las columnas.
+- La instantánea se reconstruye desde cero solo si la base fue reemplazada:
+  cambió la identidad del fichero (generate_data.py y backup.py restore la
+  sustituyen con os.replace) o ya no existe el último voto importado. La API
+  nunca borra votos ni modifica votes.id.
+- DELETE /voters/{id} y DELETE /candidates/{id} añaden el id eliminado a
+  deletions.log (fichero de solo anexar, 16 bytes por registro: tipo e id).
+  refresh() lee el registro desde la última posición leída:
+  - Cada votante eliminado se busca en voters_voter_id (ordenada,
+    searchsorted) y su dominio se anota en las columnas deleted_*. Los
+    votantes registrados por dominio son los importados menos los
+    eliminados, sin releer la tabla.
+  - SQLite reutiliza el id más alto tras un borrado (no hay AUTOINCREMENT):
+    si un id eliminado vuelve a existir en voters, la fila de la instantánea
+    pasa al dominio del votante nuevo en lugar de anotarse como eliminada.
+  - Al eliminar un votante o un candidato la base deja votes.voter_id o
+    votes.candidate_id a NULL; los votos afectados de la instantánea pasan a
+    dominio '' o candidate_id 0, lo mismo que produce una reconstrucción.
+- Si quedan más de BUILD_THRESHOLD filas por importar (primera consulta o
+  base regenerada), la importación se hace en un hilo en segundo plano y
+  refresh() devuelve "building" sin esperar. Tampoco espera si otro hilo o
+  worker está actualizando: el informe se calcula con lo ya importado.
+- meta.json se reemplaza de forma atómica después de escribir las columnas,
+  así que una interrupción nunca deja filas a medio escribir como válidas.
+- Varios workers comparten los ficheros; la actualización se serializa con
+  un bloqueo de fichero. Los informes solo usan un bloqueo en memoria que la
+  actualización toma brevemente al añadir cada lote.
+
+El esquema no guarda la fecha de cada voto, por lo que los histogramas se
+calculan sobre el orden de emisión (votes.id).
+
+Uso:
+    python analytics.py check   # compara la instantánea con la base
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+import numpy as np
+from sqlalchemy import func, select
+from database import SessionLocal, engine
+from models.vote import Vote
+from models.voter import Voter
+from tally import tally, FileLock
+
+# Carpeta de la instantánea columnar.
+ANALYTICS_DIR = os.path.join("databases", "analytics")
+
+# Filas leídas de la base de datos por consulta durante la actualización.
+BATCH_SIZE = 100_000
+
+# Filas pendientes a partir de las cuales la importación pasa a segundo plano.
+BUILD_THRESHOLD = 50_000
+
+# Capacidad inicial (filas) de cada columna; se duplica al llenarse.
+INITIAL_CAPACITY = 1024
+
+VOTE_COLUMNS = {"vote_id": np.int64, "voter_id": np.int64, "candidate_id": np.int32, "domain": np.int32}
+VOTER_COLUMNS = {"voter_id": np.int64, "domain": np.int32}
+DELETED_COLUMNS = {"voter_id": np.int64, "domain": np.int32}
+
+# Registros de deletions.log: tipo (DELETED_VOTER o DELETED_CANDIDATE) e id.
+DELETED_VOTER = 0
+DELETED_CANDIDATE = 1
+_DELETION = struct.Struct("<qq")
+
+# Ids por consulta al comprobar votantes reutilizados (límite de variables de SQLite).
+_IN_CHUNK = 500
+
+REPORTS = ("candidate", "domain", "candidate_domain", "participation", "histogram")
+
+
+def email_domain(email):
+    """Extrae el dominio (en minúsculas) de un correo; '' si no tiene."""
+    if not email or "@" not in email:
+        return ""
+    return email.rsplit("@", 1)[1].strip().lower()
+
+
+def _database_id():
+    """Dispositivo e inodo del fichero de la base; cambian si se reemplaza."""
+    try:
+        stat = os.stat(engine.url.database)
+    except OSError:
+        return None
+    return [stat.st_dev, stat.st_ino]
+
+
+class _ColumnTable:
+    """
+    Conjunto de columnas de igual longitud respaldadas por ficheros memmap.
+    """
+    def __init__(self, directory, prefix, columns):
+        self._directory = directory
+        self._prefix = prefix
+        self._columns = columns
+        self.count = 0
+        self.capacity = 0
+        self.last_id = 0
+        self.epoch = 0
+        self._arrays = {}
+
+    def _path(self, name):
+        return os.path.join(self._directory, f"{self._prefix}_{name}.bin")
+
+    def open(self, count, capacity, last_id, epoch=0):
+        """Mapea los ficheros con la capacidad indicada."""
+        self.count, self.last_id, self.epoch = count, last_id, epoch
+        self._map(max(capacity, INITIAL_CAPACITY))
+
+    def _map(self, capacity):
+        for name, dtype in self._columns.items():
+            path = self._path(name)
+            size = capacity * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            self._arrays[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def reset(self):
+        """Descarta todas las filas (la capacidad se conserva)."""
+        self.count = 0
+        self.last_id = 0
+        self.epoch += 1
+
+    def append(self, values, last_id):
+        """Añade filas al final. values: dict columna -> numpy.ndarray."""
+        n = len(next(iter(values.values())))
+        if self.count + n > self.capacity:
+            capacity = self.capacity
+            while self.count + n > capacity:
+                capacity *= 2
+            self.flush()
+            self._map(capacity)
+        for name, array in values.items():
+            self._arrays[name][self.count:self.count + n] = array
+        self.count += n
+        self.last_id = last_id
+
+    def flush(self):
+        for array in self._arrays.values():
+            array.flush()
+
+    def column(self, name, count=None):
+        """Vista de solo las filas válidas de una columna."""
+        return self._arrays[name][:self.count if count is None else count]
+
+    def meta(self):
+        return {"count": self.count, "capacity": self.capacity, "last_id": self.last_id, "epoch": self.epoch}
+
+
+class VoteAnalytics:
+    """
+    Instantánea columnar de votos y votantes con agregaciones NumPy.
+
+    Uso:
+        analytics.refresh()
+        analytics.report("candidate_domain", limit=20)
+    """
+    def __init__(self, directory=ANALYTICS_DIR):
+        self._directory = directory
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._deletions_log = os.path.join(directory, "deletions.log")
+        self._votes = _ColumnTable(directory, "votes", VOTE_COLUMNS)
+        self._voters = _ColumnTable(directory, "voters", VOTER_COLUMNS)
+        # last_id de esta tabla es la posición (bytes) leída de deletions.log.
+        self._deleted = _ColumnTable(directory, "deleted", DELETED_COLUMNS)
+        self._domains = []
+        self._domain_codes = {}
+        self._database = None
+        self._loaded_meta = None
+        # _lock protege el estado en memoria que leen los informes; _file_lock
+        # serializa las actualizaciones entre hilos y workers.
+        self._lock = threading.Lock()
+        self._file_lock = None
+        self._builder = None
+        self._builder_lock = threading.Lock()
+        self._reset_aggregates()
+
+    def _reset_aggregates(self):
+        # Conteos acumulados en memoria: matriz candidato × dominio y votantes
+        # por dominio, junto al número de filas ya sumadas.
+        self._matrix = np.zeros((0, 0), np.int64)
+        self._matrix_rows = 0
+        self._matrix_epoch = None
+        self._registered = np.zeros(0, np.int64)
+        self._registered_rows = 0
+        self._deleted_rows = 0
+        self._registered_epoch = None
+
+    def _domain_code(self, domain):
+        code = self._domain_codes.get(domain)
+        if code is None:
+            code = len(self._domains)
+            self._domains.append(domain)
+            self._domain_codes[domain] = code
+        return code
+
+    def _load_meta(self):
+        """Relee meta.json si otro worker lo actualizó."""
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"votes": {"count": 0, "capacity": 0, "last_id": 0},
+                    "voters": {"count": 0, "capacity": 0, "last_id": 0},
+                    "deleted": {"count": 0, "capacity": 0, "last_id": 0},
+                    "database": None,
+                    "domains": []}
+        # Instantáneas anteriores al registro de eliminaciones no tienen
+        # "deleted" ni "database": se reconstruyen en la próxima actualización.
+        meta.setdefault("deleted", {"count": 0, "capacity": 0, "last_id": 0})
+        if meta == self._loaded_meta:
+            return
+        self._votes.open(**meta["votes"])
+        self._voters.open(**meta["voters"])
+        self._deleted.open(**meta["deleted"])
+        self._database = meta.get("database")
+        self._domains = list(meta["domains"])
+        self._domain_codes = {d: i for i, d in enumerate(self._domains)}
+        self._loaded_meta = meta
+
+    def _save_meta(self):
+        self._votes.flush()
+        self._voters.flush()
+        self._deleted.flush()
+        meta = {"votes": self._votes.meta(), "voters": self._voters.meta(), "deleted": self._deleted.meta(),
+                "database": self._database, "domains": list(self._domains)}
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+        self._loaded_meta = meta
+
+    def _import_votes(self, db):
+        while True:
+            rows = db.execute(
+                select(Vote.id, Vote.voter_id, Vote.candidate_id, Voter.email)
+                .outerjoin(Voter, Voter.id == Vote.voter_id)
+                .where(Vote.id > self._votes.last_id)
+                .order_by(Vote.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                return
+            values = {
+                "vote_id": np.fromiter((r[0] for r in rows), np.int64, len(rows)),
+                "voter_id": np.fromiter((r[1] or 0 for r in rows), np.int64, len(rows)),
+                "candidate_id": np.fromiter((r[2] or 0 for r in rows), np.int32, len(rows)),
+                "domain": np.fromiter((self._domain_code(email_domain(r[3])) for r in rows), np.int32, len(rows)),
+            }
+            with self._lock:
+                self._votes.append(values, rows[-1][0])
+            if len(rows) < BATCH_SIZE:
+                return
+
+    def _import_voters(self, db):
+        while True:
+            rows = db.execute(
+                select(Voter.id, Voter.email)
+                .where(Voter.id > self._voters.last_id)
+                .order_by(Voter.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                return
+            values = {
+                "voter_id": np.fromiter((r[0] for r in rows), np.int64, len(rows)),
+                "domain": np.fromiter((self._domain_code(email_domain(r[1])) for r in rows), np.int32, len(rows)),
+            }
+            with self._lock:
+                self._voters.append(values, rows[-1][0])
+            if len(rows) < BATCH_SIZE:
+                return
+
+    def _deletions_log_size(self):
+        try:
+            return os.path.getsize(self._deletions_log)
+        except FileNotFoundError:
+            return 0
+
+    def _import_deletions(self, db):
+        """
+        Aplica los registros nuevos de deletions.log. Se ejecuta antes de
+        importar votos y votantes, para que las filas nuevas con un id
+        reutilizado no se confundan con las eliminadas.
+        """
+        offset = self._deleted.last_id
+        size = self._deletions_log_size()
+        size -= (size - offset) % _DELETION.size  # Solo registros completos
+        if size <= offset:
+            return
+        with open(self._deletions_log, "rb") as f:
+            f.seek(offset)
+            records = np.frombuffer(f.read(size - offset), np.int64).reshape(-1, 2)
+        # Solo la primera eliminación de un id se refiere a la fila importada;
+        # las siguientes son de votantes creados y eliminados después, que
+        # nunca llegaron a la instantánea.
+        voters = np.unique(records[records[:, 0] == DELETED_VOTER, 1])
+        candidates = np.unique(records[records[:, 0] == DELETED_CANDIDATE, 1])
+
+        voter_ids = self._voters.column("voter_id")
+        index = np.minimum(np.searchsorted(voter_ids, voters), max(len(voter_ids) - 1, 0))
+        found = (voter_ids[index] == voters) if len(voter_ids) else np.zeros(len(voters), bool)
+        index, found = index[found], voters[found]
+        reused = self._reused_voters(db, found)
+        is_reused = np.isin(found, np.fromiter(reused, np.int64, len(reused)))
+
+        empty_domain = self._domain_code("")
+        with self._lock:
+            self._deleted.append({
+                "voter_id": found[~is_reused],
+                "domain": self._voters.column("domain")[index[~is_reused]],
+            }, size)
+            if reused:
+                # Mismo id, votante nuevo: la fila pasa a su dominio en lugar
+                # de contarse como eliminada.
+                domains = self._voters.column("domain")
+                for position, voter_id in zip(index[is_reused].tolist(), found[is_reused].tolist()):
+                    domains[position] = self._domain_code(reused[voter_id])
+                self._voters.epoch += 1
+            vote_voters = self._votes.column("voter_id")
+            vote_candidates = self._votes.column("candidate_id")
+            orphan_voter = np.flatnonzero(np.isin(vote_voters, voters))
+            orphan_candidate = np.flatnonzero(np.isin(vote_candidates, candidates))
+            if len(orphan_voter) or len(orphan_candidate):
+                vote_voters[orphan_voter] = 0
+                self._votes.column("domain")[orphan_voter] = empty_domain
+                vote_candidates[orphan_candidate] = 0
+                # Filas modificadas: los conteos en memoria se recalculan.
+                self._votes.epoch += 1
+
+    def _reused_voters(self, db, voter_ids):
+        """Dominio de los ids eliminados que vuelven a existir en voters."""
+        reused = {}
+        voter_ids = voter_ids.tolist()
+        for i in range(0, len(voter_ids), _IN_CHUNK):
+            rows = db.execute(
+                select(Voter.id, Voter.email).where(Voter.id.in_(voter_ids[i:i + _IN_CHUNK]))
+            ).all()
+            reused.update((r[0], email_domain(r[1])) for r in rows)
+        return reused
+
+    def _log_deletion(self, kind, entity_id):
+        os.makedirs(self._directory, exist_ok=True)
+        fd = os.open(self._deletions_log, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            os.write(fd, _DELETION.pack(kind, entity_id))
+        finally:
+            os.close(fd)
+
+    def voter_deleted(self, voter_id):
+        """
+        Registra un votante eliminado para descontarlo en la próxima
+        actualización. Se llama después de confirmar el borrado.
+        """
+        self._log_deletion(DELETED_VOTER, voter_id)
+
+    def candidate_deleted(self, candidate_id):
+        """
+        Registra un candidato eliminado: sus votos pasan a candidate_id 0 en
+        la próxima actualización. Se llama después de confirmar el borrado.
+        """
+        self._log_deletion(DELETED_CANDIDATE, candidate_id)
+
+    def _snapshot_matches(self, db):
+        """
+        Comprueba que la instantánea corresponde a la base actual: mismo
+        fichero, último voto importado presente y registro de eliminaciones
+        sin truncar.
+        """
+        if self._database != _database_id():
+            return False
+        if self._deletions_log_size() < self._deleted.last_id:
+            return False
+        if not self._votes.count:
+            return True
+        return db.execute(select(Vote.id).where(Vote.id == self._votes.last_id)).first() is not None
+
+    def _pending(self, db):
+        """Filas por importar, estimadas con el id máximo de cada tabla."""
+        max_vote = db.execute(select(func.max(Vote.id))).scalar() or 0
+        max_voter = db.execute(select(func.max(Voter.id))).scalar() or 0
+        if not self._snapshot_matches(db):
+            return max_vote + max_voter
+        return max(0, max_vote - self._votes.last_id) + max(0, max_voter - self._voters.last_id)
+
+    def _update(self, blocking):
+        """
+        Importa las filas nuevas y guarda meta.json.
+
+        Retorna:
+        - bool: False si no se esperó al bloqueo y lo tenía otro hilo o worker.
+        """
+        if not self._file_lock.acquire(blocking):
+            return False
+        try:
+            with self._lock:
+                self._load_meta()
+                before = (self._votes.meta(), self._voters.meta(), self._deleted.meta(), self._database)
+            db = SessionLocal()
+            try:
+                if not self._snapshot_matches(db):
+                    # La base fue restaurada o regenerada: empezar de cero. Las
+                    # eliminaciones anteriores del registro ya no aplican.
+                    with self._lock:
+                        self._votes.reset()
+                        self._voters.reset()
+                        self._deleted.reset()
+                        self._deleted.last_id = self._deletions_log_size()
+                        self._database = _database_id()
+                self._import_deletions(db)
+                self._import_votes(db)
+                self._import_voters(db)
+            except BaseException:
+                # Descartar lo importado sin guardar: se releerá meta.json.
+                with self._lock:
+                    self._loaded_meta = None
+                    self._reset_aggregates()
+                raise
+            finally:
+                db.close()
+            with self._lock:
+                if (self._votes.meta(), self._voters.meta(), self._deleted.meta(), self._database) != before:
+                    self._save_meta()
+        finally:
+            self._file_lock.release()
+        return True
+
+    def _open_file_lock(self):
+        """Crea el bloqueo de fichero en el primer uso. Requiere self._builder_lock."""
+        if self._file_lock is None:
+            os.makedirs(self._directory, exist_ok=True)
+            self._file_lock = FileLock(os.path.join(self._directory, "refresh.lock"))
+
+    def _build(self):
+        self._update(blocking=True)
+
+    def refresh(self):
+        """
+        Incorpora a la instantánea los votos, votantes y eliminaciones nuevos.
+
+        Si hay muchas filas pendientes la importación continúa en segundo
+        plano; si otro hilo o worker está actualizando no se espera.
+
+        Retorna:
+        - str: "ready" si la instantánea está al día o "building" si se está
+          construyendo y los informes pueden estar incompletos.
+        """
+        with self._builder_lock:
+            if self._builder is not None and self._builder.is_alive():
+                return "building"
+            self._open_file_lock()
+        with self._lock:
+            self._load_meta()
+        db = SessionLocal()
+        try:
+            pending = self._pending(db)
+        finally:
+            db.close()
+        if pending > BUILD_THRESHOLD:
+            with self._builder_lock:
+                if self._builder is None or not self._builder.is_alive():
+                    self._builder = threading.Thread(target=self._build, name="analytics-build", daemon=True)
+                    self._builder.start()
+            return "building"
+        return "ready" if self._update(blocking=False) else "building"
+
+    def _top(self, counts, labels, limit):
+        """Convierte un vector de conteos en una lista ordenada de mayor a menor."""
+        nonzero = np.flatnonzero(counts)
+        if limit and len(nonzero) > limit:
+            nonzero = nonzero[np.argpartition(counts[nonzero], -limit)[-limit:]]
+        nonzero = nonzero[np.argsort(counts[nonzero], kind="stable")[::-1]]
+        return [dict(labels(int(i)), votes=int(counts[i])) for i in nonzero]
+
+    def _update_aggregates(self, n_votes, n_voters, n_deleted, n_domains):
+        """
+        Suma a los conteos en memoria solo las filas nuevas de la instantánea.
+
+        La primera llamada recorre todas las columnas; las siguientes solo el
+        tramo añadido desde la anterior, así el coste de un informe no depende
+        del total de votos. Requiere self._lock.
+        """
+        if self._matrix_epoch != self._votes.epoch or self._matrix_rows > n_votes:
+            self._reset_aggregates()
+            self._matrix_epoch = self._votes.epoch
+        candidate_ids = self._votes.column("candidate_id", n_votes)[self._matrix_rows:]
+        rows, cols = self._matrix.shape
+        rows = max(rows, int(candidate_ids.max()) + 1 if len(candidate_ids) else 0)
+        cols = max(cols, n_domains)
+        if (rows, cols) != self._matrix.shape:
+            grown = np.zeros((rows, cols), np.int64)
+            grown[:self._matrix.shape[0], :self._matrix.shape[1]] = self._matrix
+            self._matrix = grown
+        if len(candidate_ids):
+            vote_domains = self._votes.column("domain", n_votes)[self._matrix_rows:]
+            keys = candidate_ids.astype(np.int64) * cols + vote_domains
+            # Nuevo array: report() usa la matriz anterior fuera del bloqueo.
+            self._matrix = self._matrix + np.bincount(keys, minlength=rows * cols).reshape(rows, cols)
+        self._matrix_rows = n_votes
+
+        if (self._registered_epoch != self._voters.epoch
+                or self._registered_rows > n_voters or self._deleted_rows > n_deleted):
+            self._registered = np.zeros(0, np.int64)
+            self._registered_rows = 0
+            self._deleted_rows = 0
+            self._registered_epoch = self._voters.epoch
+        voter_domains = self._voters.column("domain", n_voters)[self._registered_rows:]
+        deleted_domains = self._deleted.column("domain", n_deleted)[self._deleted_rows:]
+        registered = np.zeros(cols, np.int64)
+        registered[:len(self._registered)] = self._registered
+        registered += np.bincount(voter_domains, minlength=cols)
+        registered -= np.bincount(deleted_domains, minlength=cols)
+        self._registered = registered
+        self._registered_rows = n_voters
+        self._deleted_rows = n_deleted
+
+    def report(self, kind, limit=100, buckets=10):
+        """
+        Calcula un informe sobre la instantánea actual.
+
+        Parámetros:
+        - kind: uno de REPORTS.
+        - limit: número máximo de grupos devueltos (0 = todos).
+        - buckets: número de tramos del histograma.
+
+        Retorna:
+        - dict con el total de votos y las filas del informe.
+        """
+        if kind not in REPORTS:
+            raise ValueError(f"Informe no válido: {kind}")
+        counts = tally.read()
+        names = {c["id"]: c["name"] for c in counts["candidates"]} if counts else {}
+        with self._lock:
+            n_votes, n_voters, n_deleted = self._votes.count, self._voters.count, self._deleted.count
+            domains = list(self._domains)
+            self._update_aggregates(n_votes, n_voters, n_deleted, max(len(domains), 1))
+            matrix, registered = self._matrix, self._registered
+            vote_ids = self._votes.column("vote_id", n_votes)
+        n_domains = matrix.shape[1]
+        result = {"total_votes": n_votes}
+
+        if kind == "candidate":
+            result["rows"] = self._top(
+                matrix.sum(axis=1), lambda i: {"candidate_id": i, "candidate": names.get(i)}, limit)
+        elif kind == "domain":
+            result["rows"] = self._top(matrix.sum(axis=0), lambda i: {"domain": domains[i]}, limit)
+        elif kind == "candidate_domain":
+            result["rows"] = self._top(
+                matrix.ravel(), lambda i: {"candidate_id": i // n_domains, "candidate": names.get(i // n_domains),
+                                           "domain": domains[i % n_domains]}, limit)
+        elif kind == "participation":
+            voted = matrix.sum(axis=0)
+            order = np.argsort(registered, kind="stable")[::-1]
+            if limit:
+                order = order[:limit]
+            n_registered = n_voters - n_deleted
+            result["registered"] = n_registered
+            result["rate"] = round(n_votes / n_registered * 100, 2) if n_registered else 0
+            result["rows"] = [{
+                "domain": domains[i],
+                "registered": int(registered[i]),
+                "votes": int(voted[i]),
+                "rate": round(voted[i] / registered[i] * 100, 2) if registered[i] else 0,
+            } for i in order if registered[i] or voted[i]]
+        elif kind == "histogram":
+            # Los votos se importan ordenados por id: los tramos salen de searchsorted.
+            result["rows"] = []
+            if n_votes:
+                edges = np.unique(np.linspace(vote_ids[0], vote_ids[-1] + 1, buckets + 1).astype(np.int64))
+                counts = np.diff(np.searchsorted(vote_ids, edges))
+                result["rows"] = [{"from_vote_id": int(edges[i]), "to_vote_id": int(edges[i + 1]) - 1,
+                                   "votes": int(counts[i])} for i in range(len(counts))]
+        return result
+
+    def check(self):
+        """
+        Actualiza la instantánea y compara sus totales con consultas SQL sobre
+        la base: votos por candidato, votos por dominio y votantes
+        registrados por dominio.
+
+        Retorna:
+        - list[str]: diferencias encontradas (vacía si coinciden).
+        """
+        with self._builder_lock:
+            self._open_file_lock()
+        self._update(blocking=True)
+        expected = {"candidate": {}, "domain": {}, "registered": {}}
+        db = SessionLocal()
+        try:
+            for candidate_id, votes in db.execute(select(Vote.candidate_id, func.count()).group_by(Vote.candidate_id)):
+                expected["candidate"][candidate_id or 0] = votes
+            for (email,) in db.execute(select(Voter.email).select_from(Vote).outerjoin(Voter, Voter.id == Vote.voter_id)):
+                domain = email_domain(email)
+                expected["domain"][domain] = expected["domain"].get(domain, 0) + 1
+            for (email,) in db.execute(select(Voter.email)):
+                domain = email_domain(email)
+                expected["registered"][domain] = expected["registered"].get(domain, 0) + 1
+        finally:
+            db.close()
+
+        with self._lock:
+            domains = list(self._domains)
+            self._update_aggregates(self._votes.count, self._voters.count, self._deleted.count, max(len(domains), 1))
+            matrix, registered = self._matrix, self._registered
+        actual = {
+            "candidate": {i: int(n) for i, n in enumerate(matrix.sum(axis=1)) if n},
+            "domain": {domains[i]: int(n) for i, n in enumerate(matrix.sum(axis=0)) if n},
+            "registered": {domains[i]: int(n) for i, n in enumerate(registered) if n},
+        }
+        differences = []
+        for name in expected:
+            for key in sorted(expected[name].keys() | actual[name].keys(), key=str):
+                if expected[name].get(key, 0) != actual[name].get(key, 0):
+                    differences.append(f"{name} {key!r}: base {expected[name].get(key, 0)}, "
+                                       f"instantánea {actual[name].get(key, 0)}")
+        return differences
+
+
+analytics = VoteAnalytics()
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos."""
+    parser = argparse.ArgumentParser(description="Instantánea de analítica de votaciones")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("check", help="Comparar la instantánea con la base de datos")
+    parser.parse_args(argv)
+
+    differences = analytics.check()
+    for line in differences:
+        print(line)
+    print("La instantánea coincide con la base" if not differences else f"{len(differences)} diferencias")
+    raise SystemExit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
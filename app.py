@@ -16,6 +16,9 @@ Dependencias del workspace:
   -> Voters: [`router`](routers/voter.py) en [routers/voter.py](routers/voter.py)
   -> Candidates: [`router`](routers/candidates.py) en [routers/candidates.py](routers/candidates.py)
   -> Votes: [`router`](routers/votes.py) en [routers/votes.py](routers/votes.py)
+  -> Admin: [`router`](routers/admin.py) en [routers/admin.py](routers/admin.py)
+- Middleware de perfilado por petición:
+  -> [`ProfilingMiddleware`](profiling.py)
 
 Notas de despliegue:
 - La configuración de conexión está en database.py. Para desarrollo local usa
@@ -23,7 +26,8 @@ Notas de despliegue:
 """
 from fastapi import FastAPI
 from database import Base, engine
-from routers import voter, candidates,votes
+from routers import voter, candidates,votes,admin
+from profiling import ProfilingMiddleware
 
 # Crear tablas
 Base.metadata.create_all(bind=engine)
@@ -33,6 +37,10 @@ app = FastAPI(title="Sistema de Votaciones",
             Incluye endpoints para crear votantes, emitir votos y consultar resultados.
             """)
 
+# Perfilado opcional: cabecera X-Profile de confianza o muestreo (PROFILE_SAMPLE_RATE)
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(voter.router)
 app.include_router(candidates.router)
-app.include_router(votes.router)
\ No newline at end of file
+app.include_router(votes.router)
+app.include_router(admin.router)
\ No newline at end of file
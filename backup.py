@@ -0,0 +1,338 @@
+"""
+backup.py
+---------
+Copias de seguridad en caliente y restauración de la base de datos SQLite.
+
+Este módulo usa la API de backup en línea de SQLite (sqlite3.Connection.backup)
+para copiar databases/votaciones.db mientras la API sigue recibiendo votos.
+La copia se hace por pasos de N páginas y entre paso y paso se cede el control
+(time.sleep), de modo que los escritores solo quedan bloqueados durante un
+paso corto y nunca durante toda la exportación.
+
+Cada commit de otra conexión obliga a SQLite a reiniciar la copia desde la
+primera página. Con escrituras continuas la copia por pasos podría no
+terminar nunca, así que tras MAX_RESTARTS reinicios se descarta lo copiado y
+se repite la copia completa en un único paso, y toda la operación está
+acotada por un plazo (DEFAULT_TIMEOUT) que lanza SnapshotError.
+
+Ese paso único lee la base entera con un lock de lectura. La API usa el modo
+WAL (database.py), así que los commits no esperan: se escriben en el fichero
+-wal, que crece durante la copia porque los checkpoints no pueden avanzar
+hasta que termina. Sobre una base en modo rollback journal (sin WAL) los
+commits sí esperarían toda la copia y fallarían con "database is locked" si
+dura más que el busy timeout (5 s). La copia resultante se guarda en modo
+DELETE para que sea un único fichero.
+
+Flujo de una copia (create_snapshot):
+1. Copia en línea, paso a paso, a un fichero temporal.
+2. Verificación del fichero copiado con PRAGMA integrity_check.
+3. Compresión gzip a databases/snapshots/votaciones-AAAAMMDD-HHMMSS-xxxxxx.db.gz
+   (xxxxxx es un sufijo aleatorio para que dos copias del mismo segundo no
+   colisionen) junto a un fichero .sha256 con el hash del contenido comprimido.
+
+Restauración (restore_snapshot):
+- Verifica el hash, descomprime a un temporal, comprueba su integridad y lo
+  coloca en su sitio con un os.replace atómico. Pensado para aprovisionar un
+  nodo nuevo o recuperar una instancia detenida.
+
+Uso por línea de comandos:
+    python backup.py backup [--pages 256] [--sleep 0.005] [--timeout 300]
+    python backup.py list
+    python backup.py restore databases/snapshots/votaciones-....db.gz [--target ruta.db]
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Ruta del fichero SQLite usado por database.py (DATABASE_URL).
+DATABASE_PATH = os.path.join("databases", "votaciones.db")
+
+# Carpeta donde se guardan las copias comprimidas.
+SNAPSHOT_DIR = os.path.join("databases", "snapshots")
+
+# Páginas copiadas por paso y pausa entre pasos (segundos).
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP = 0.005
+
+# Reinicios tolerados antes de copiar en un solo paso y plazo total (segundos).
+MAX_RESTARTS = 3
+DEFAULT_TIMEOUT = 300.0
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotError(Exception):
+    """Error al crear, verificar o restaurar una copia de seguridad."""
+
+
+def _sha256(path):
+    """Calcula el hash SHA-256 de un fichero leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _check_integrity(path):
+    """
+    Ejecuta PRAGMA integrity_check sobre el fichero indicado.
+
+    Lanza SnapshotError si SQLite reporta cualquier problema.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    if result != [("ok",)]:
+        raise SnapshotError(f"La copia no superó integrity_check: {result}")
+
+
+class _BackupInterrupted(Exception):
+    """Detiene la copia por pasos desde el callback de progreso."""
+
+
+def online_backup(target_path, source_path=DATABASE_PATH,
+                  pages=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_STEP_SLEEP,
+                  timeout=DEFAULT_TIMEOUT):
+    """
+    Copia la base de datos en caliente a target_path.
+
+    Parámetros:
+    - target_path: fichero destino (se sobrescribe).
+    - source_path: base de datos origen.
+    - pages: páginas copiadas en cada paso de la API de backup.
+    - sleep: pausa entre pasos para dejar paso a los escritores.
+    - timeout: plazo total en segundos.
+
+    Retorna:
+    - dict: páginas copiadas, reinicios detectados y si se terminó en un
+      único paso.
+    """
+    if not os.path.exists(source_path):
+        raise SnapshotError(f"No existe la base de datos {source_path}")
+
+    deadline = time.monotonic() + timeout
+    state = {"pages": 0, "remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        state["pages"] = total - remaining
+        # Si quedan más páginas que en el paso anterior, un commit de otra
+        # conexión ha reiniciado la copia.
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] >= MAX_RESTARTS:
+                raise _BackupInterrupted
+        state["remaining"] = remaining
+        if time.monotonic() > deadline:
+            raise _BackupInterrupted
+        # Ceder el control entre pasos: los escritores pueden tomar el lock.
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    single_step = False
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _BackupInterrupted:
+            if time.monotonic() > deadline:
+                raise SnapshotError(f"La copia no terminó en {timeout} s "
+                                    f"({state['restarts']} reinicios por escrituras)")
+            # Copia completa desde el principio en un solo paso: mantiene el
+            # lock de lectura hasta el final, así que ningún commit puede
+            # reiniciarla. En modo WAL los commits no esperan a este lock.
+            single_step = True
+            source.backup(target, pages=-1)
+            state["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+        # La copia hereda el modo WAL del origen; sin él es un único fichero.
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    return {"pages": state["pages"], "restarts": state["restarts"], "single_step": single_step}
+
+
+def create_snapshot(source_path=DATABASE_PATH, snapshot_dir=SNAPSHOT_DIR,
+                    pages=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_STEP_SLEEP,
+                    timeout=DEFAULT_TIMEOUT):
+    """
+    Crea una copia comprimida y verificada de la base de datos.
+
+    Retorna:
+    - dict con el nombre del fichero, tamaños, páginas copiadas, reinicios,
+      hash y duración.
+    """
+    started = time.perf_counter()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = ("votaciones-" + datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+            + "-" + uuid.uuid4().hex[:6] + ".db.gz")
+    snapshot_path = os.path.join(snapshot_dir, name)
+
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=snapshot_dir)
+    os.close(fd)
+    partial_path = snapshot_path + ".part"
+    try:
+        copy = online_backup(raw_path, source_path, pages=pages, sleep=sleep, timeout=timeout)
+        _check_integrity(raw_path)
+
+        # Nivel 6: buena relación tamaño/velocidad para ficheros SQLite.
+        with open(raw_path, "rb") as src, gzip.open(partial_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+        os.replace(partial_path, snapshot_path)
+
+        checksum = _sha256(snapshot_path)
+        with open(snapshot_path + ".sha256", "w", encoding="utf-8") as f:
+            f.write(f"{checksum}  {name}\n")
+
+        raw_size = os.path.getsize(raw_path)
+    finally:
+        for path in (raw_path, partial_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return {
+        "snapshot": name,
+        "pages": copy["pages"],
+        "restarts": copy["restarts"],
+        "single_step": copy["single_step"],
+        "size": raw_size,
+        "compressed_size": os.path.getsize(snapshot_path),
+        "sha256": checksum,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def list_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    """
+    Lista las copias disponibles, de la más reciente a la más antigua.
+
+    Retorna:
+    - list[dict]: nombre, tamaño comprimido y fecha de modificación (UTC).
+    """
+    if not os.path.isdir(snapshot_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(snapshot_dir):
+        if not name.endswith(".db.gz"):
+            continue
+        path = os.path.join(snapshot_dir, name)
+        stat = os.stat(path)
+        snapshots.append({
+            "snapshot": name,
+            "compressed_size": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+        })
+    snapshots.sort(key=lambda s: s["snapshot"], reverse=True)
+    return snapshots
+
+
+def snapshot_path(name, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Devuelve la ruta de una copia a partir de su nombre.
+
+    Solo acepta nombres simples (sin directorios) para no salir de snapshot_dir.
+    """
+    if os.path.basename(name) != name or not name.endswith(".db.gz"):
+        raise SnapshotError("Nombre de copia no válido")
+    path = os.path.join(snapshot_dir, name)
+    if not os.path.exists(path):
+        raise SnapshotError("No existe la copia solicitada")
+    return path
+
+
+def restore_snapshot(path, target_path=DATABASE_PATH):
+    """
+    Restaura una copia comprimida sobre target_path.
+
+    Verifica el hash (si existe el fichero .sha256) y la integridad del
+    contenido antes de reemplazar el destino con os.replace, que es atómico
+    dentro del mismo sistema de ficheros. No debe ejecutarse con la API
+    escribiendo sobre target_path.
+
+    Retorna:
+    - dict con la ruta restaurada, su tamaño y la duración.
+    """
+    started = time.perf_counter()
+    if not os.path.exists(path):
+        raise SnapshotError(f"No existe la copia {path}")
+
+    checksum_path = path + ".sha256"
+    if os.path.exists(checksum_path):
+        with open(checksum_path, encoding="utf-8") as f:
+            expected = f.read().split()[0]
+        if _sha256(path) != expected:
+            raise SnapshotError("El hash de la copia no coincide")
+
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=target_dir)
+    try:
+        with os.fdopen(fd, "wb") as dst, gzip.open(path, "rb") as src:
+            shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+        _check_integrity(tmp_path)
+        # Evitar que SQLite aplique un diario antiguo sobre la base restaurada.
+        for suffix in ("-journal", "-wal", "-shm"):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        os.replace(tmp_path, target_path)
+    except (OSError, sqlite3.DatabaseError) as e:
+        raise SnapshotError(f"No se pudo restaurar la copia: {e}") from e
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        "restored": target_path,
+        "size": os.path.getsize(target_path),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos."""
+    parser = argparse.ArgumentParser(description="Copias de seguridad de votaciones.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_backup = sub.add_parser("backup", help="Crear una copia en caliente")
+    p_backup.add_argument("--source", default=DATABASE_PATH)
+    p_backup.add_argument("--dir", default=SNAPSHOT_DIR)
+    p_backup.add_argument("--pages", type=int, default=DEFAULT_PAGES_PER_STEP)
+    p_backup.add_argument("--sleep", type=float, default=DEFAULT_STEP_SLEEP)
+    p_backup.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+
+    p_list = sub.add_parser("list", help="Listar copias disponibles")
+    p_list.add_argument("--dir", default=SNAPSHOT_DIR)
+
+    p_restore = sub.add_parser("restore", help="Restaurar una copia")
+    p_restore.add_argument("snapshot", help="Ruta del fichero .db.gz")
+    p_restore.add_argument("--target", default=DATABASE_PATH)
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "backup":
+            result = create_snapshot(args.source, args.dir, pages=args.pages, sleep=args.sleep,
+                                     timeout=args.timeout)
+            print(f"Copia creada: {result['snapshot']} ({result['pages']} páginas, "
+                  f"{result['compressed_size']} bytes, {result['seconds']} s)")
+        elif args.command == "list":
+            for s in list_snapshots(args.dir):
+                print(f"{s['snapshot']}\t{s['compressed_size']}\t{s['created_at']}")
+        elif args.command == "restore":
+            result = restore_snapshot(args.snapshot, args.target)
+            print(f"Restaurada en {result['restored']} ({result['size']} bytes, {result['seconds']} s)")
+    except SnapshotError as e:
+        parser.exit(1, f"Error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
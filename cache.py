@@ -0,0 +1,182 @@
+"""
+cache.py
+--------
+Caché LRU con expiración (TTL) para las consultas de entidades por id.
+
+Los clientes de los puntos de votación consultan una y otra vez los mismos
+votantes y candidatos (GET /voters/{id}, GET /candidates/{id}). Esta caché
+guarda la respuesta ya serializada en JSON (VoterResponseGet /
+CandidateResponseGet) para devolverla sin abrir consulta a SQLite ni volver a
+validar con Pydantic.
+
+Invalidación:
+- create_vote invalida el votante (cambia has_voted) y el candidato (cambia
+  votes); las rutas DELETE invalidan la entidad eliminada.
+- Las entradas viven en la memoria de cada worker, pero las generaciones se
+  publican en un bloque de multiprocessing.shared_memory con GENERATION_SLOTS
+  contadores (SharedGenerations). Cada clave se asigna a un contador por su
+  CRC32; invalidar una clave incrementa su contador y cualquier worker que la
+  tenga guardada con la generación anterior la descarta en el siguiente get.
+  Dos claves que comparten contador solo provocan algún fallo de más.
+- Una lectura que empezó antes de una invalidación no guarda su resultado
+  (set con el token de generation(key)), así no se reintroducen datos viejos.
+
+Estadísticas (aciertos, fallos, expulsiones, expiraciones) disponibles con
+stats() y en GET /admin/cache.
+"""
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from tally import attach_shared_memory, shared_memory_name
+
+# Número máximo de entradas y segundos de validez de cada una.
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL = 10.0
+
+# Contadores de generación compartidos entre workers.
+GENERATION_SLOTS = 65536
+
+_COUNTER = struct.Struct("<q")
+
+
+class SharedGenerations:
+    """
+    Contadores de generación por clave en memoria compartida.
+
+    El incremento no es atómico entre procesos: si dos workers invalidan a
+    la vez la misma ranura puede perderse un incremento, pero el contador
+    cambia igualmente y eso basta para descartar las entradas anteriores.
+    """
+    def __init__(self, name, slots=GENERATION_SLOTS):
+        self._name = name
+        self._slots = slots
+        self._buf = None
+        self._attach_lock = threading.Lock()
+
+    def _buffer(self):
+        if self._buf is None:
+            with self._attach_lock:
+                if self._buf is None:
+                    self._shm = attach_shared_memory(self._name, self._slots * _COUNTER.size)
+                    self._buf = self._shm.buf
+        return self._buf
+
+    def _offset(self, key):
+        # hash() de str cambia entre procesos; CRC32 de repr(key) no.
+        return zlib.crc32(repr(key).encode()) % self._slots * _COUNTER.size
+
+    def get(self, key):
+        """Generación actual de la clave."""
+        return _COUNTER.unpack_from(self._buffer(), self._offset(key))[0]
+
+    def bump(self, key):
+        """Incrementa la generación de la clave."""
+        buf, offset = self._buffer(), self._offset(key)
+        _COUNTER.pack_into(buf, offset, _COUNTER.unpack_from(buf, offset)[0] + 1)
+
+
+class TTLCache:
+    """
+    Caché LRU acotada con expiración por entrada y segura entre hilos.
+
+    Con shared (SharedGenerations) las invalidaciones llegan a todos los
+    procesos que usan el mismo bloque compartido.
+    """
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, shared=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._shared = shared
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _shared_generation(self, key):
+        return self._shared.get(key) if self._shared is not None else 0
+
+    def generation(self, key):
+        """Token que se pasa a set() para descartar lecturas ya invalidadas."""
+        return self._generation, self._shared_generation(key)
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe, expiró o se invalidó."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, shared_generation = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if shared_generation != self._shared_generation(key):
+                # Invalidada por otro worker.
+                del self._data[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        """
+        Guarda un valor. Si se indica generation y hubo una invalidación
+        desde que se obtuvo, el valor se descarta.
+        """
+        with self._lock:
+            current = self.generation(key)
+            if generation is not None and generation != current:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl, current[1])
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Elimina las entradas indicadas en este y en el resto de procesos."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+                if self._shared is not None:
+                    self._shared.bump(key)
+
+    def clear(self):
+        """Elimina todas las entradas (las estadísticas se conservan)."""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        Retorna:
+        - dict con tamaño, límites y contadores de la caché.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Caché compartida por las rutas de votantes y candidatos.
+# Claves: ("voter", id) y ("candidate", id).
+entity_cache = TTLCache(shared=SharedGenerations(shared_memory_name("cache")))
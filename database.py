@@ -13,8 +13,11 @@ Elementos exportados:
 - SessionLocal: fábrica de sesiones para obtener sesiones DB.
 - Base: clase base declarativa para definir modelos ORM.
 - get_db: generador/context manager recomendado para obtener y liberar sesiones
+
+Cada conexión activa el modo WAL (PRAGMA journal_mode=WAL): las lecturas,
+incluidas las copias en caliente de backup.py, no bloquean los commits.
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Cadena de conexión: usa SQLite ubicado en la carpeta 'databases' del proyecto.
@@ -25,6 +28,13 @@ engine = create_engine(
     DATABASE_URL, connect_args={"check_same_thread": False}
 )
 
+#WAL: un lector no bloquea a los escritores (el modo queda guardado en el fichero)
+@event.listens_for(engine, "connect")
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 #Base declarativa, padre para los modelos
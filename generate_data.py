@@ -0,0 +1,202 @@
+"""
+generate_data.py
+----------------
+Generador de elecciones sintéticas para pruebas de escala.
+
+Crea una base de datos SQLite con el mismo esquema que la API (se crea con
+Base.metadata a partir de los modelos) y la llena con millones de votantes,
+candidatos y votos en segundos, sin pasar por la API:
+
+- Los datos se generan con numpy.random a partir de una semilla, así que la
+  misma semilla y los mismos parámetros producen exactamente la misma base.
+- La carga usa sqlite3.executemany por tabla dentro de una única transacción,
+  con el diario y la sincronización desactivados. Se escribe en un fichero
+  temporal que se mueve al destino al terminar, por lo que una carga
+  interrumpida nunca deja una base a medias.
+- voters.has_voted y candidates.votes quedan coherentes con la tabla votes.
+
+Distribuciones configurables:
+- --turnout: fracción de votantes que votan.
+- --skew: exponente tipo Zipf del reparto de votos entre candidatos
+  (0 = uniforme; valores mayores concentran los votos en los primeros).
+- --duplicate-email-rate: fracción de votantes cuyo correo repite el de otro
+  votante cambiando mayúsculas/minúsculas. La API solo rechaza correos
+  idénticos, así que estos registros son aceptados igual que en producción.
+
+Uso:
+    python generate_data.py --voters 1000000 --candidates 12 --seed 7
+    python generate_data.py --output databases/votaciones.db --force
+"""
+import argparse
+import os
+import sqlite3
+import time
+import numpy as np
+from sqlalchemy import create_engine
+from database import Base
+from models.voter import Voter
+from models.candidate import Candidate
+from models.vote import Vote
+
+DEFAULT_OUTPUT = os.path.join("databases", "synthetic.db")
+
+# Dominios de correo y su peso relativo.
+DOMAINS = ["gmail.com", "hotmail.com", "outlook.com", "yahoo.com", "icloud.com",
+           "empresa.com.co", "universidad.edu.co"]
+DOMAIN_WEIGHTS = [0.45, 0.2, 0.12, 0.08, 0.05, 0.06, 0.04]
+
+
+def candidate_weights(candidates, skew):
+    """
+    Probabilidad de voto de cada candidato: 1 / rango^skew, normalizada.
+    """
+    weights = 1.0 / np.arange(1, candidates + 1, dtype=np.float64) ** skew
+    return weights / weights.sum()
+
+
+def _swap_case(email, rng):
+    """Variante del correo con mayúsculas aleatorias (al menos una)."""
+    chars = list(email)
+    letters = [i for i, ch in enumerate(chars) if ch.isalpha() and ch.islower()]
+    for i in rng.choice(letters, size=max(1, len(letters) // 3), replace=False):
+        chars[i] = chars[i].upper()
+    return "".join(chars)
+
+
+def generate(voters, candidates, turnout, skew, duplicate_email_rate, seed, parties=None):
+    """
+    Genera las filas de la elección en memoria.
+
+    Retorna:
+    - dict con las listas de filas "voters", "candidates" y "votes" listas para
+      executemany, en el orden de las columnas de cada tabla.
+    """
+    rng = np.random.default_rng(seed)
+    parties = parties or max(1, candidates // 2)
+
+    # Correos: una parte de los votantes repite el correo de un votante
+    # anterior con otra combinación de mayúsculas.
+    domain_idx = rng.choice(len(DOMAINS), size=voters, p=DOMAIN_WEIGHTS)
+    emails = [f"votante{i}@{DOMAINS[d]}" for i, d in enumerate(domain_idx.tolist(), start=1)]
+    duplicates = np.flatnonzero(rng.random(voters) < duplicate_email_rate)
+    duplicates = duplicates[duplicates > 0]
+    originals = (rng.random(len(duplicates)) * duplicates).astype(np.int64)
+    used = set(emails)
+    rewritten = 0
+    for dup, orig in zip(duplicates.tolist(), originals.tolist()):
+        base = emails[orig].lower()
+        # La columna email es UNIQUE: se reintenta si la variante ya existe.
+        for _ in range(10):
+            variant = _swap_case(base, rng)
+            if variant not in used:
+                used.discard(emails[dup])
+                used.add(variant)
+                emails[dup] = variant
+                rewritten += 1
+                break
+
+    # Participación y elección de candidato.
+    voted = rng.random(voters) < turnout
+    voter_ids = np.flatnonzero(voted) + 1
+    rng.shuffle(voter_ids)  # Orden de emisión de los votos
+    choices = rng.choice(candidates, size=len(voter_ids), p=candidate_weights(candidates, skew)) + 1
+    votes_per_candidate = np.bincount(choices, minlength=candidates + 1)
+
+    return {
+        "voters": list(zip(range(1, voters + 1),
+                           (f"Votante {i}" for i in range(1, voters + 1)),
+                           emails,
+                           voted.tolist())),
+        "candidates": [(i, f"Candidato {i}", f"Partido {(i - 1) % parties + 1}", int(votes_per_candidate[i]))
+                       for i in range(1, candidates + 1)],
+        "votes": list(zip(range(1, len(voter_ids) + 1), voter_ids.tolist(), choices.tolist())),
+        "duplicate_emails": rewritten,
+    }
+
+
+def load(path, data):
+    """
+    Crea el esquema en path y carga las filas generadas en una transacción.
+
+    Los índices secundarios de los modelos se crean después de la carga:
+    construirlos de una vez es más rápido que mantenerlos fila a fila.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+    for index in indexes:
+        index.drop(bind=engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        # Caché amplia: el índice UNIQUE de email se inserta en orden aleatorio.
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.execute("BEGIN")
+        for table, columns in ((Voter.__table__, "id, name, email, has_voted"),
+                               (Candidate.__table__, "id, name, party, votes"),
+                               (Vote.__table__, "id, voter_id, candidate_id")):
+            placeholders = ", ".join("?" * len(columns.split(",")))
+            sql = f"INSERT INTO {table.name} ({columns}) VALUES ({placeholders})"
+            conn.executemany(sql, data[table.name])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    for index in indexes:
+        index.create(bind=engine)
+    engine.dispose()
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos."""
+    parser = argparse.ArgumentParser(description="Genera una base de datos de votaciones sintética")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Fichero SQLite destino")
+    parser.add_argument("--force", action="store_true", help="Sobrescribir el destino si existe")
+    parser.add_argument("--voters", type=int, default=1_000_000)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--parties", type=int, default=None)
+    parser.add_argument("--turnout", type=float, default=0.65)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--duplicate-email-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.voters < 1 or args.candidates < 1:
+        parser.error("--voters y --candidates deben ser mayores que 0")
+    if not 0 <= args.turnout <= 1 or not 0 <= args.duplicate_email_rate <= 1:
+        parser.error("--turnout y --duplicate-email-rate deben estar entre 0 y 1")
+    if args.skew < 0:
+        parser.error("--skew no puede ser negativo")
+    if os.path.exists(args.output) and not args.force:
+        parser.error(f"{args.output} ya existe; use --force para sobrescribirlo")
+
+    started = time.perf_counter()
+    data = generate(args.voters, args.candidates, args.turnout, args.skew,
+                    args.duplicate_email_rate, args.seed, args.parties)
+    generated = time.perf_counter()
+
+    tmp_path = args.output + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        load(tmp_path, data)
+        # Evitar que SQLite aplique el -wal de la base anterior sobre la nueva.
+        for suffix in ("-journal", "-wal", "-shm"):
+            if os.path.exists(args.output + suffix):
+                os.remove(args.output + suffix)
+        os.replace(tmp_path, args.output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finished = time.perf_counter()
+
+    print(f"{args.output}: {len(data['voters'])} votantes, {len(data['candidates'])} candidatos, "
+          f"{len(data['votes'])} votos, {data['duplicate_emails']} correos duplicados")
+    print(f"Generación {generated - started:.1f} s, carga {finished - generated:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+profiling.py
+------------
+Perfilado opcional por petición y captura de peticiones lentas.
+
+Una petición se perfila cuando:
+- trae la cabecera X-Profile con el valor de ADMIN_TOKEN (petición de
+  confianza, se guarda siempre y la respuesta incluye X-Profile-Id), o
+- cae en la fracción muestreada PROFILE_SAMPLE_RATE (0 por defecto); en ese
+  caso solo se guarda si tarda al menos PROFILE_SLOW_MS.
+
+Qué se mide:
+- Tiempo de ejecución SQL (sql_execute_ms) y número de consultas, con los
+  eventos before/after cursor_execute del engine. Ese intervalo solo cubre
+  cursor.execute: la lectura de filas (fetchall/fetchone) ocurre después y
+  no se cronometra; aparece en el muestreo como la fase fetch.
+- Tiempo de commit (fsync de SQLite), desde el evento commit de la conexión
+  hasta after_commit de la sesión.
+- Un perfilador estadístico que cada PROFILE_INTERVAL segundos toma la pila
+  de los hilos que atienden la petición en ese momento:
+  - los hilos del threadpool mientras ejecutan el endpoint síncrono o la
+    validación de su response_model (las rutas usan ProfiledRoute, que
+    registra el hilo al entrar en cada llamada y lo retira al salir);
+  - el hilo del bucle de eventos, solo si la tarea asyncio en curso es la
+    de la petición (el bucle es compartido con el resto de peticiones).
+  Cada muestra se clasifica por fase:
+  validation (Pydantic/serialización), orm (hidratación SQLAlchemy), fetch
+  (lectura de filas del cursor), sql, commit o app. Las pilas se guardan en formato "collapsed" (flamegraph).
+  El periodo real entre muestras es mayor que PROFILE_INTERVAL (sleep, GIL),
+  así que cada muestra pesa el tiempo medido desde la pasada anterior:
+  sampled_ms es ese tiempo acumulado por fase, y samples y sampled_percent
+  dan el número de muestras y su reparto.
+
+Los perfiles se guardan como JSON en databases/profiles/, que funciona como
+un buffer circular de PROFILE_MAX_ARTIFACTS ficheros. Se consultan en
+GET /admin/profiles y GET /admin/profiles/{id}.
+"""
+import asyncio
+import functools
+import hmac
+import inspect
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import event
+from database import engine, SessionLocal
+
+PROFILE_DIR = os.path.join("databases", "profiles")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "500"))
+PROFILE_MAX_ARTIFACTS = int(os.environ.get("PROFILE_MAX_ARTIFACTS", "50"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+
+PROFILE_HEADER = b"x-profile"
+
+_MAX_DEPTH = 64
+
+# Prefijos de módulo usados para clasificar una muestra, del más interno al
+# más externo de la pila.
+_PHASES = (
+    ("sql", ("sqlalchemy.engine", "sqlite3")),
+    ("orm", ("sqlalchemy.orm",)),
+    ("validation", ("pydantic", "fastapi.encoders", "fastapi._compat")),
+)
+_COMMIT_FUNCTIONS = {"_commit_impl", "do_commit"}
+_FETCH_FUNCTIONS = ("fetch", "_fetch", "_allrows")
+_IDLE_MODULES = {"selectors", "threading", "queue"}
+
+_active = ContextVar("request_profile", default=None)
+_local = threading.local()
+_ids = itertools.count()
+
+
+class RequestProfile:
+    """
+    Datos de perfilado de una petición. Se crea dentro de la tarea asyncio
+    que atiende la petición.
+    """
+    def __init__(self, method, path, forced):
+        self.id = f"{int(time.time() * 1000):013d}-{os.getpid()}-{next(_ids)}"
+        self.method = method
+        self.path = path
+        self.forced = forced
+        self.status = None
+        self.started = time.perf_counter()
+        self.total_ms = 0.0
+        self.sql_execute_ms = 0.0
+        self.sql_queries = 0
+        self.commit_ms = 0.0
+        self.samples = Counter()
+        self.sampled_seconds = Counter()
+        self.passes = 0
+        self.pass_seconds = 0.0
+        self.stacks = Counter()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._loop_thread = threading.get_ident()
+        self._threads = Counter()
+        self._lock = threading.Lock()
+
+    def enter_thread(self):
+        """Incluye el hilo actual en el muestreo hasta exit_thread()."""
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def threads(self):
+        """Hilos que trabajan ahora para la petición."""
+        with self._lock:
+            threads = list(self._threads)
+        if asyncio.current_task(self._loop) is self._task:
+            threads.append(self._loop_thread)
+        return threads
+
+    def add_sql(self, seconds):
+        with self._lock:
+            self.sql_execute_ms += seconds * 1000
+            self.sql_queries += 1
+
+    def add_commit(self, seconds):
+        with self._lock:
+            self.commit_ms += seconds * 1000
+
+    def add_pass(self, seconds):
+        """Registra una pasada del muestreador y el tiempo que representa."""
+        self.passes += 1
+        self.pass_seconds += seconds
+
+    def sample(self, frame, seconds):
+        """Registra una muestra de la pila de un hilo que representa seconds."""
+        stack = []
+        while frame is not None and len(stack) < _MAX_DEPTH:
+            stack.append((frame.f_globals.get("__name__", "?"), frame.f_code.co_name))
+            frame = frame.f_back
+        if not stack or stack[0][0] in _IDLE_MODULES:
+            return
+        phase = _classify(stack)
+        collapsed = ";".join(f"{module}:{func}" for module, func in reversed(stack))
+        with self._lock:
+            self.samples[phase] += 1
+            self.sampled_seconds[phase] += seconds
+            self.stacks[collapsed] += 1
+
+    def to_dict(self):
+        total_samples = sum(self.samples.values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "forced": self.forced,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "phases": {
+                "total_ms": round(self.total_ms, 3),
+                "sql_execute_ms": round(self.sql_execute_ms, 3),
+                "sql_queries": self.sql_queries,
+                "commit_ms": round(self.commit_ms, 3),
+                "sampled_ms": {phase: round(t * 1000, 3) for phase, t in self.sampled_seconds.items()},
+                "samples": dict(self.samples),
+                "sampled_percent": {phase: round(n / total_samples * 100, 1) for phase, n in self.samples.items()},
+            },
+            "interval_ms": PROFILE_INTERVAL * 1000,
+            "measured_interval_ms": round(self.pass_seconds / self.passes * 1000, 3) if self.passes else None,
+            "stacks": dict(self.stacks.most_common()),
+        }
+
+
+def _classify(stack):
+    """Fase de una muestra según el primer módulo reconocido desde la hoja."""
+    for module, func in stack:
+        if module.startswith("sqlalchemy.engine") and func in _COMMIT_FUNCTIONS:
+            return "commit"
+    # La hidratación del ORM se ejecuta dentro de los fetch del Result: solo
+    # es fetch si la función de lectura está más cerca de la hoja que el ORM.
+    for module, func in stack:
+        if module.startswith("sqlalchemy.orm"):
+            break
+        if module.startswith("sqlalchemy.engine") and func.startswith(_FETCH_FUNCTIONS):
+            return "fetch"
+    for module, func in stack:
+        for phase, prefixes in _PHASES:
+            if module.startswith(prefixes):
+                return phase
+    return "app"
+
+
+class _Sampler:
+    """
+    Hilo que muestrea periódicamente las pilas de las peticiones activas.
+    Solo trabaja mientras haya algún perfil en curso.
+    """
+    def __init__(self):
+        self._profiles = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, profile):
+        with self._cond:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, profile):
+        with self._cond:
+            self._profiles.discard(profile)
+
+    def _run(self):
+        last = time.perf_counter()
+        while True:
+            with self._cond:
+                if not self._profiles:
+                    while not self._profiles:
+                        self._cond.wait()
+                    last = time.perf_counter()
+                profiles = list(self._profiles)
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for profile in profiles:
+                # Tiempo real desde la pasada anterior (o desde que empezó la petición).
+                elapsed = now - max(last, profile.started)
+                profile.add_pass(elapsed)
+                for ident in profile.threads():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.sample(frame, elapsed)
+            del frames
+            last = now
+            time.sleep(PROFILE_INTERVAL)
+
+
+_sampler = _Sampler()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    if profile is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    starts = conn.info.get("profile_query_start")
+    if profile is not None and starts:
+        profile.add_sql(time.perf_counter() - starts.pop())
+
+
+@event.listens_for(engine, "commit")
+def _before_commit(conn):
+    # El evento de la conexión se dispara justo antes del commit del driver.
+    if _active.get() is not None:
+        _local.commit_start = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    profile = _active.get()
+    start = getattr(_local, "commit_start", None)
+    if profile is not None and start is not None:
+        profile.add_commit(time.perf_counter() - start)
+    _local.commit_start = None
+
+
+def _sampled_in_thread(function):
+    """
+    Envuelve una función que FastAPI ejecuta en el threadpool para que el
+    hilo se muestree solo mientras dura la llamada.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = _active.get()
+        if profile is None:
+            return function(*args, **kwargs)
+        profile.enter_thread()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.exit_thread()
+    wrapper.sampled_in_thread = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """
+    APIRoute cuyos endpoints síncronos registran su hilo en el perfil de la
+    petición. Se usa con APIRouter(route_class=ProfiledRoute).
+    """
+    def __init__(self, path, endpoint, **kwargs):
+        self._sync = not inspect.iscoroutinefunction(endpoint)
+        # include_router vuelve a crear la ruta con el endpoint ya envuelto.
+        if self._sync and not getattr(endpoint, "sampled_in_thread", False):
+            endpoint = _sampled_in_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        # FastAPI (0.121, la versión de requirement.txt) valida la respuesta
+        # de los endpoints síncronos en otra llamada al threadpool con
+        # secure_cloned_response_field.validate; APIRoute.__init__ llama a
+        # este método después de crear ese campo. Otras versiones no lo
+        # tienen: la validación no se muestrea, pero la ruta funciona.
+        field = getattr(self, "secure_cloned_response_field", None)
+        if self._sync and field is not None and not getattr(field.validate, "sampled_in_thread", False):
+            field.validate = _sampled_in_thread(field.validate)
+        return super().get_route_handler()
+
+
+def _trusted(headers):
+    """Comprueba la cabecera X-Profile contra ADMIN_TOKEN."""
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        return False
+    for name, value in headers:
+        if name == PROFILE_HEADER:
+            return hmac.compare_digest(value, expected.encode())
+    return False
+
+
+def save_profile(profile, directory=PROFILE_DIR, max_artifacts=PROFILE_MAX_ARTIFACTS):
+    """
+    Guarda el perfil como JSON y elimina los más antiguos por encima de
+    max_artifacts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{profile.id}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f)
+    os.replace(tmp_path, path)
+    names = sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+    for name in names[:max(0, len(names) - max_artifacts)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """
+    Lista los perfiles guardados, del más reciente al más antiguo.
+
+    Retorna:
+    - list[dict]: id, método, ruta, estado, duración y fecha de cada perfil.
+    """
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(directory) if n.endswith(".json")), reverse=True):
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({
+            "id": data["id"],
+            "method": data["method"],
+            "path": data["path"],
+            "status": data["status"],
+            "total_ms": data["phases"]["total_ms"],
+            "created_at": data["created_at"],
+        })
+    return profiles
+
+
+def profile_path(profile_id, directory=PROFILE_DIR):
+    """
+    Ruta del fichero de un perfil, o None si no existe o el id no es válido.
+    """
+    if os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+        return None
+    path = os.path.join(directory, f"{profile_id}.json")
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila las peticiones de confianza o muestreadas.
+
+    Las peticiones que no se perfilan pasan directamente a la aplicación.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        forced = _trusted(scope["headers"])
+        if not forced and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], forced)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if forced:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _active.set(profile)
+        _sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _sampler.remove(profile)
+            _active.reset(token)
+            profile.total_ms = (time.perf_counter() - profile.started) * 1000
+            if forced or profile.total_ms >= PROFILE_SLOW_MS:
+                # Escritura del JSON y rotación de ficheros fuera del bucle de eventos.
+                await run_in_threadpool(save_profile, profile)
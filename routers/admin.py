@@ -0,0 +1,161 @@
+"""
+Módulo de rutas de administración de la API.
+
+Este módulo expone operaciones de mantenimiento que no forman parte del
+proceso de votación, como las copias de seguridad en caliente de la base de
+datos.
+
+Rutas definidas:
+- POST /admin/backups : Crea una copia en caliente comprimida y verificada.
+- GET /admin/backups : Lista las copias disponibles.
+- GET /admin/backups/{name} : Descarga una copia.
+- GET /admin/cache : Estadísticas de la caché de votantes y candidatos.
+- DELETE /admin/cache : Vacía la caché de votantes y candidatos.
+- GET /admin/profiles : Lista los perfiles de peticiones guardados.
+- GET /admin/profiles/{id} : Descarga un perfil.
+
+Seguridad:
+- Todas las rutas exigen la cabecera X-Admin-Token con el valor de la variable
+  de entorno ADMIN_TOKEN. Si ADMIN_TOKEN no está definida, las rutas quedan
+  deshabilitadas (403).
+
+La restauración no se expone por HTTP: reemplazar la base de datos con la API
+en marcha no es seguro. Se hace con `python backup.py restore`.
+"""
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+import backup
+import profiling
+from cache import entity_cache
+
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    """
+    Dependencia que valida la cabecera X-Admin-Token contra ADMIN_TOKEN.
+    """
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(403, "Administración deshabilitada")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(403, "Token de administración no válido")
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)], route_class=profiling.ProfiledRoute)
+
+@router.post("/backups"
+             ,summary="Crear copia de seguridad"
+             ,description="""Copia la base de datos en caliente con la API de backup de SQLite,
+             por pasos de N páginas, sin detener las escrituras. Si las escrituras reinician la copia varias veces se
+             termina en un único paso; si no acaba en timeout segundos se aborta. La copia se verifica y se guarda comprimida."""
+             ,responses={200: {"description": "Datos de la copia creada"},
+                         403: {"description": "Token de administración no válido"
+                               ,"content":{"application/json":{"example":{"detail":"Token de administración no válido"}}}},
+                         500: {"description": "Error al crear la copia"}})
+def create_backup(pages: int = backup.DEFAULT_PAGES_PER_STEP, sleep: float = backup.DEFAULT_STEP_SLEEP,
+                  timeout: float = backup.DEFAULT_TIMEOUT):
+    """
+    Crea una copia de seguridad comprimida de la base de datos.
+
+    Parámetros:
+    - pages: páginas copiadas en cada paso.
+    - sleep: pausa en segundos entre pasos.
+    - timeout: plazo total de la copia en segundos.
+
+    Retorna:
+    - dict: nombre, tamaños, reinicios, hash y duración de la copia.
+    """
+    if pages <= 0 or sleep < 0 or timeout <= 0:
+        raise HTTPException(422, "pages y timeout deben ser mayores que 0 y sleep no negativo")
+    try:
+        return backup.create_snapshot(pages=pages, sleep=sleep, timeout=timeout)
+    except backup.SnapshotError as e:
+        raise HTTPException(500, str(e))
+
+@router.get("/backups"
+            ,summary="Listar copias de seguridad"
+            ,description="Se consultan las copias de seguridad disponibles, de la más reciente a la más antigua."
+            ,responses={200: {"description": "Lista de copias"}})
+def list_backups():
+    """
+    Lista las copias de seguridad disponibles.
+
+    Retorna:
+    - list[dict]: nombre, tamaño comprimido y fecha de cada copia.
+    """
+    return backup.list_snapshots()
+
+@router.get("/backups/{name}"
+            ,summary="Descargar copia de seguridad"
+            ,description="Descarga el fichero comprimido de una copia de seguridad."
+            ,responses={200: {"description": "Fichero .db.gz"},
+                        404: {"description": "No existe la copia solicitada"
+                              ,"content":{"application/json":{"example":{"detail":"No existe la copia solicitada"}}}}})
+def download_backup(name: str):
+    """
+    Devuelve el fichero de una copia de seguridad.
+
+    Parámetros:
+    - name: nombre del fichero .db.gz.
+    """
+    try:
+        path = backup.snapshot_path(name)
+    except backup.SnapshotError as e:
+        raise HTTPException(404, str(e))
+    return FileResponse(path, media_type="application/gzip", filename=name)
+
+@router.get("/cache"
+            ,summary="Estadísticas de la caché"
+            ,description="Aciertos, fallos, expulsiones y expiraciones de la caché de votantes y candidatos de este worker."
+            ,responses={200: {"description": "Estadísticas de la caché"}})
+def cache_stats():
+    """
+    Devuelve las estadísticas de la caché de entidades.
+
+    Retorna:
+    - dict: tamaño, límites y contadores de la caché.
+    """
+    return entity_cache.stats()
+
+@router.delete("/cache"
+               ,summary="Vaciar la caché"
+               ,description="Elimina todas las entradas de la caché de votantes y candidatos de este worker."
+               ,responses={200: {"description": "Caché vaciada"
+                                 ,"content":{"application/json":{"example":{"message":"Caché vaciada"}}}}})
+def clear_cache():
+    """
+    Vacía la caché de entidades.
+    """
+    entity_cache.clear()
+    return {"message": "Caché vaciada"}
+
+@router.get("/profiles"
+            ,summary="Listar perfiles de peticiones"
+            ,description="""Se consultan los perfiles guardados (peticiones con cabecera X-Profile o muestreadas que superaron
+            PROFILE_SLOW_MS), del más reciente al más antiguo."""
+            ,responses={200: {"description": "Lista de perfiles"}})
+def list_profiles():
+    """
+    Lista los perfiles de peticiones guardados.
+
+    Retorna:
+    - list[dict]: id, método, ruta, estado, duración y fecha de cada perfil.
+    """
+    return profiling.list_profiles()
+
+@router.get("/profiles/{id}"
+            ,summary="Descargar perfil de petición"
+            ,description="Descarga el JSON de un perfil: desglose por fases y pilas muestreadas en formato collapsed."
+            ,responses={200: {"description": "Fichero JSON del perfil"},
+                        404: {"description": "No existe el perfil solicitado"
+                              ,"content":{"application/json":{"example":{"detail":"No existe el perfil solicitado"}}}}})
+def download_profile(id: str):
+    """
+    Devuelve el fichero de un perfil.
+
+    Parámetros:
+    - id: identificador del perfil (cabecera X-Profile-Id o listado).
+    """
+    path = profiling.profile_path(id)
+    if path is None:
+        raise HTTPException(404, "No existe el perfil solicitado")
+    return FileResponse(path, media_type="application/json", filename=f"{id}.json")
@@ -13,14 +13,18 @@ Endpoints:
 - DELETE /candidates/{id}  -> Eliminar un candidato por id.
 
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models.voter import Voter
 from models.candidate import Candidate
 from schemas.candidate_schema import CandidateCreate, CandidateResponse,CandidateResponseGet
+from tally import tally
+from cache import entity_cache
+from profiling import ProfiledRoute
+from analytics import analytics
 
-router = APIRouter(prefix="/candidates", tags=["Candidates"])
+router = APIRouter(prefix="/candidates", tags=["Candidates"], route_class=ProfiledRoute)
 
 def get_db():
     """
@@ -64,8 +68,11 @@ def create_candidate(candidate: CandidateCreate, db: Session = Depends(get_db)):
         raise HTTPException(404,"Esta candidato ya está registrado.")
     db_candidate = Candidate(**candidate.dict())
     db.add(db_candidate)
-    db.commit()
-    db.refresh(db_candidate)
+    #Confirmar y registrar el candidato en el conteo compartido entre workers
+    with tally.update() as t:
+        db.commit()
+        db.refresh(db_candidate)
+        t.add_candidate(db_candidate)
 
     return CandidateResponse(
         id=db_candidate.id,
@@ -105,6 +112,8 @@ def get_candidate(id: int, db: Session = Depends(get_db)):
     """
     Busca un candidato por id.
 
+    La respuesta serializada se guarda en la caché de entidades (cache.py).
+
     Parámetros:
     - id: int, identificador del candidato.
     - db: Sesión de base de datos.
@@ -112,10 +121,15 @@ def get_candidate(id: int, db: Session = Depends(get_db)):
     Devuelve:
     - CandidateResponseGet si existe, si no -> HTTPException(404).
     """
-    candidate = db.query(Candidate).get(id)
-    if not candidate:
-        raise HTTPException(404, "Candidato no encontrado")
-    return candidate
+    payload = entity_cache.get(("candidate", id))
+    if payload is None:
+        generation = entity_cache.generation(("candidate", id))
+        candidate = db.query(Candidate).get(id)
+        if not candidate:
+            raise HTTPException(404, "Candidato no encontrado")
+        payload = CandidateResponseGet.model_validate(candidate).model_dump_json().encode()
+        entity_cache.set(("candidate", id), payload, generation)
+    return Response(payload, media_type="application/json")
 
 @router.delete("/{id}"
                ,summary="Eliminar candidato por Id"
@@ -140,5 +154,9 @@ def delete_candidate(id: int, db: Session = Depends(get_db)):
     if not candidate:
         raise HTTPException(404, "Candidato no encontrado")
     db.delete(candidate)
-    db.commit()
+    with tally.update() as t:
+        db.commit()
+        t.remove_candidate(id)
+    entity_cache.invalidate(("candidate", id))
+    analytics.candidate_deleted(id)
     return {"message": "Candidato eliminado"}
@@ -16,14 +16,18 @@ Dependencias:
 - SQLAlchemy: para la interacción con la base de datos.
 - Schemas Pydantic: para la validación de datos de entrada y salida.
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models.voter import Voter
 from models.candidate import Candidate
 from schemas.voter_schema import VoterResponse, VoterCreate, VoterResponseGet
+from tally import tally
+from cache import entity_cache
+from profiling import ProfiledRoute
+from analytics import analytics
 
-router = APIRouter(prefix="/voters", tags=["Voters"])
+router = APIRouter(prefix="/voters", tags=["Voters"], route_class=ProfiledRoute)
 
 def get_db():
     """
@@ -71,7 +75,10 @@ def create_voter(voter: VoterCreate, db: Session = Depends(get_db)):
 
     db_voter = Voter(**voter.dict())
     db.add(db_voter)
-    db.commit()
+    #Confirmar y sumar el votante al conteo compartido entre workers
+    with tally.update() as t:
+        db.commit()
+        t.add_voter()
     db.refresh(db_voter)
 
     return VoterResponse(
@@ -114,10 +121,16 @@ def list_voters(db: Session = Depends(get_db)):
                               }}
             )
 def get_voter(id: int, db: Session = Depends(get_db)):
-    voter = db.get(Voter, id) #Se consulta la información en la bd
-    if not voter:
-        raise HTTPException(404, "No se encontró votante")
-    return voter
+    #Se responde desde la caché si el votante se consultó recientemente
+    payload = entity_cache.get(("voter", id))
+    if payload is None:
+        generation = entity_cache.generation(("voter", id))
+        voter = db.get(Voter, id) #Se consulta la información en la bd
+        if not voter:
+            raise HTTPException(404, "No se encontró votante")
+        payload = VoterResponseGet.model_validate(voter).model_dump_json().encode()
+        entity_cache.set(("voter", id), payload, generation)
+    return Response(payload, media_type="application/json")
 
 @router.delete("/{id}"
                ,summary="Eliminar votante por Id"
@@ -140,6 +153,11 @@ def delete_voter(id: int, db: Session = Depends(get_db)):
     voter = db.query(Voter).get(id)
     if not voter:
         raise HTTPException(404, "No se encontró votante para eliminar")
+    has_voted = voter.has_voted
     db.delete(voter)
-    db.commit()
+    with tally.update() as t:
+        db.commit()
+        t.remove_voter(has_voted)
+    entity_cache.invalidate(("voter", id))
+    analytics.voter_deleted(id)
     return {"message": "Votante eliminado"}
@@ -9,21 +9,30 @@ Rutas definidas:
 - POST /votes/ : Crea un nuevo voto.
 - GET /votes/ : Lista todos los votos registrados.
 - GET /votes/statistics : Obtiene estadísticas de votación.
+- GET /votes/analytics : Informes agregados sobre la instantánea columnar de votos.
 
 Dependencias:
 - FastAPI: para la creación de la API.
 - SQLAlchemy: para la interacción con la base de datos.
 - Schemas Pydantic: para la validación de datos de entrada y salida.
 """
-from fastapi import APIRouter, Depends, HTTPException
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models.vote import Vote
 from models.voter  import Voter
 from models.candidate import Candidate
 from schemas.votes_schema import VoteCreate,VotesResponse,VotesResponseGet
+from tally import tally
+from cache import entity_cache
+from profiling import ProfiledRoute
+from analytics import analytics, REPORTS
 
-router = APIRouter(prefix="/votes", tags=["Votes"])
+router = APIRouter(prefix="/votes", tags=["Votes"], route_class=ProfiledRoute)
+
+# Filas máximas de un informe de analítica (limit y buckets).
+MAX_ROWS = 1000
 
 def get_db():
     """
@@ -84,7 +93,12 @@ def create_vote(vote: VoteCreate, db: Session = Depends(get_db)):
     #Aumenta el conteo de votos para el candidato
     candidate.votes += 1
 
-    db.commit()
+    #Confirmar y actualizar el conteo compartido entre workers
+    with tally.update() as t:
+        db.commit()
+        t.add_vote(vote.candidate_id)
+    #El votante (has_voted) y el candidato (votes) cambiaron: invalidar la caché
+    entity_cache.invalidate(("voter", vote.voter_id), ("candidate", vote.candidate_id))
     db.refresh(db_vote)
     #return db_vote
     return VotesResponse(
@@ -118,12 +132,16 @@ def list_votes(db: Session = Depends(get_db)):
 
 @router.get("/statistics"
             ,summary="Estadísticas de votación"
-            ,description="Se consultan las estadísticas de votación, incluyendo el total de votos por candidato y el porcentaje de votos."
+            ,description="""Se consultan las estadísticas de votación, incluyendo el total de votos por candidato, el porcentaje de votos
+            y la participación. Se leen del conteo compartido entre workers, sin consultar la base de datos."""
             ,responses={200: {"description": "Estadísticas de votación"}})
 def statistics(db: Session = Depends(get_db)):
     """
-    Obtiene estadísticas de votación, incluyendo el total de votos por candidato
-    y el porcentaje de votos.
+    Obtiene estadísticas de votación, incluyendo el total de votos por candidato,
+    el porcentaje de votos y la participación.
+
+    Los datos salen del conteo en memoria compartida (tally.py). Solo se
+    consulta la base de datos si el conteo está desbordado.
 
     Parámetros:
     - db: Sesión de base de datos.
@@ -131,22 +149,66 @@ def statistics(db: Session = Depends(get_db)):
     Retorna:
     - dict: Resultados de las estadísticas de votación.
     """
-    candidates = db.query(Candidate).all()
-    total_votes = db.query(Voter).filter(Voter.has_voted == True).count()
+    data = tally.read()
+    if data is None:
+        candidates = [{"name": c.name, "party": c.party, "votes": c.votes} for c in db.query(Candidate).all()]
+        registered = db.query(Voter).count()
+        voted = db.query(Voter).filter(Voter.has_voted == True).count()
+    else:
+        candidates, registered, voted = data["candidates"], data["registered"], data["voted"]
 
     stats = []
-    total_votes = sum(c.votes for c in candidates)
+    total_votes = sum(c["votes"] for c in candidates)
 
     for c in candidates:
-        percentage = (c.votes / total_votes * 100)
+        percentage = (c["votes"] / total_votes * 100) if total_votes else 0
         stats.append({
-            "Candidato": c.name,
-            "Partido": c.party,
-            "Votos": c.votes,
+            "Candidato": c["name"],
+            "Partido": c["party"],
+            "Votos": c["votes"],
             "Porcentaje": f'{round(percentage)} %'
         })
 
+    participation = (voted / registered * 100) if registered else 0
     return {
         "Resultados": stats
         ,"Total Votantes": total_votes
+        ,"Participación": f'{round(participation)} %'
     }
+
+@router.get("/analytics"
+            ,summary="Analítica de votos"
+            ,description="""Informes agregados calculados con NumPy sobre una instantánea columnar de los votos:
+            votos por candidato (candidate), por dominio de correo (domain), cruce candidato × dominio (candidate_domain),
+            participación por dominio (participation) e histograma por orden de emisión (histogram)."""
+            ,responses={200: {"description": "Informe solicitado"},
+                        422: {"description": "Informe no válido"
+                              ,"content":{"application/json":{"example":{"detail":"Informe no válido: votes"}}}}})
+def vote_analytics(report: str = "candidate",
+                   limit: int = Query(100, ge=1, le=MAX_ROWS),
+                   buckets: int = Query(10, ge=1, le=MAX_ROWS)):
+    """
+    Calcula un informe de analítica de votos.
+
+    Antes de calcularlo incorpora a la instantánea los votos nuevos desde la
+    última consulta (actualización incremental por votes.id). Si la
+    instantánea se está construyendo, status es "building" y el informe se
+    calcula con las filas ya importadas.
+
+    Parámetros:
+    - report: candidate, domain, candidate_domain, participation o histogram.
+    - limit: número máximo de grupos devueltos (1 a MAX_ROWS).
+    - buckets: número de tramos del histograma (1 a MAX_ROWS).
+
+    Retorna:
+    - dict: estado de la instantánea, total de votos, filas del informe y
+      tiempo de cálculo en ms.
+    """
+    if report not in REPORTS:
+        raise HTTPException(422, f"Informe no válido: {report}")
+    started = time.perf_counter()
+    status = analytics.refresh()
+    result = analytics.report(report, limit=limit, buckets=buckets)
+    result["status"] = status
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
@@ -0,0 +1,366 @@
+"""
+tally.py
+--------
+Conteo de votos compartido entre los workers de uvicorn.
+
+Cuando la API se ejecuta con varios workers (uvicorn --workers N) cada proceso
+tiene su propia memoria, así que /votes/statistics tendría que consultar la
+base de datos en cada petición. Este módulo mantiene el conteo en un bloque de
+multiprocessing.shared_memory que todos los workers mapean.
+
+Estructura del bloque (enteros de 64 bits):
+- Cabecera: MAGIC (bloque inicializado), generación, votantes registrados,
+  votantes que ya votaron y marca de desbordamiento.
+- CAPACITY ranuras de ancho fijo, una por candidato (ranura = id - 1), con
+  marca de presencia, votos, nombre y partido (UTF-8, MAX_TEXT bytes).
+
+Concurrencia:
+- Los escritores se serializan con un bloqueo de fichero (flock), que el
+  sistema libera aunque el proceso muera.
+- La generación funciona como un seqlock: es impar mientras hay una escritura
+  en curso. Los lectores copian el bloque sin bloquear y reintentan si la
+  generación cambió durante la copia. Entre reintentos esperan un tiempo
+  creciente (el escritor mantiene el bloqueo durante el commit, que incluye
+  el fsync de SQLite) y solo si la generación sigue impar tras todos ellos
+  toman el bloqueo.
+- Si un worker muere a mitad de una actualización la generación queda impar;
+  el siguiente proceso que toma el bloqueo lo detecta y reconstruye el conteo
+  desde la base de datos.
+
+Si hay candidatos con id mayor que CAPACITY o textos que no caben en su
+ranura, se activa la marca de desbordamiento y las estadísticas vuelven a
+calcularse desde la base de datos.
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from sqlalchemy import func
+from database import SessionLocal, DATABASE_URL
+from models.voter import Voter
+from models.candidate import Candidate
+# Vote debe estar importado para resolver las relaciones de Voter y Candidate.
+from models.vote import Vote
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Número máximo de candidatos que caben en el bloque compartido.
+CAPACITY = 1024
+
+# Bytes reservados para el nombre y el partido de cada candidato.
+MAX_TEXT = 128
+
+MAGIC = 0x564F544F53  # "VOTOS"
+
+_HEADER = struct.Struct("<5q")
+_SLOT = struct.Struct(f"<2q{MAX_TEXT}s{MAX_TEXT}s")
+_SIZE = _HEADER.size + CAPACITY * _SLOT.size
+
+# Posiciones de los campos de la cabecera.
+_MAGIC, _GENERATION, _REGISTERED, _VOTED, _OVERFLOW = range(5)
+
+# Reintentos de lectura y espera entre ellos (se duplica hasta el máximo).
+_READ_RETRIES = 20
+_READ_BACKOFF = 0.0005
+_READ_BACKOFF_MAX = 0.01
+
+_DB_PATH = os.path.abspath(DATABASE_URL.replace("sqlite:///", "", 1))
+LOCK_PATH = _DB_PATH + ".tally.lock"
+
+
+def shared_memory_name(kind):
+    """Nombre de un bloque compartido propio de esta base de datos."""
+    return f"votaciones_{kind}_" + hashlib.sha1(_DB_PATH.encode()).hexdigest()[:12]
+
+
+SHM_NAME = shared_memory_name("tally")
+
+
+class FileLock:
+    """
+    Bloqueo exclusivo entre procesos basado en un fichero.
+
+    Se combina con un threading.Lock porque flock no excluye a los hilos de un
+    mismo proceso que comparten el descriptor.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._fd = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self, blocking=True):
+        """
+        Toma el bloqueo. Con blocking=False no espera y devuelve False si lo
+        tiene otro hilo o proceso.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self._thread_lock.release()
+                    return False
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            self._thread_lock.release()
+                            return False
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def attach_shared_memory(name=SHM_NAME, size=_SIZE):
+    """
+    Crea el bloque compartido o se conecta al existente.
+
+    El bloque no se registra en el resource_tracker: debe sobrevivir a la
+    salida del worker que lo creó, ya que el resto sigue usándolo.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _encode(text):
+    """Codifica un texto para su ranura; devuelve None si no cabe."""
+    data = (text or "").encode("utf-8")
+    return data if len(data) <= MAX_TEXT else None
+
+
+class TallyWriter:
+    """
+    Operaciones de escritura sobre el conteo. Solo se obtiene mediante
+    SharedTally.update(), que garantiza el bloqueo y la generación impar.
+    """
+    def __init__(self, tally):
+        self._tally = tally
+
+    def add_vote(self, candidate_id):
+        """Suma un voto al candidato y marca un votante más como votado."""
+        t = self._tally
+        t._add_header(_VOTED, 1)
+        slot = candidate_id - 1
+        if 0 <= slot < CAPACITY:
+            present, votes, name, party = t._slot(slot)
+            if present:
+                _SLOT.pack_into(t._buf, t._slot_offset(slot), present, votes + 1, name, party)
+                return
+        t._set_header(_OVERFLOW, 1)
+
+    def add_candidate(self, candidate):
+        """Registra un candidato nuevo en su ranura."""
+        self._tally._write_candidate(candidate.id, candidate.name, candidate.party, candidate.votes or 0)
+
+    def remove_candidate(self, candidate_id):
+        """Libera la ranura de un candidato eliminado."""
+        slot = candidate_id - 1
+        if 0 <= slot < CAPACITY:
+            _SLOT.pack_into(self._tally._buf, self._tally._slot_offset(slot), 0, 0, b"", b"")
+
+    def add_voter(self):
+        """Suma un votante registrado."""
+        self._tally._add_header(_REGISTERED, 1)
+
+    def remove_voter(self, has_voted):
+        """Resta un votante eliminado (y su participación, si votó)."""
+        self._tally._add_header(_REGISTERED, -1)
+        if has_voted:
+            self._tally._add_header(_VOTED, -1)
+
+
+class SharedTally:
+    """
+    Conteo de votos en memoria compartida.
+
+    Uso de escritura (tras confirmar en la base de datos):
+        with tally.update() as t:
+            db.commit()
+            t.add_vote(candidate.id)
+
+    Uso de lectura:
+        data = tally.read()  # None si hay que consultar la base de datos
+    """
+    def __init__(self):
+        self._shm = None
+        self._buf = None
+        self._lock = FileLock(LOCK_PATH)
+        self._attach_lock = threading.Lock()
+
+    def _attach(self):
+        """Mapea el bloque compartido y lo reconstruye al arrancar el worker."""
+        if self._buf is not None:
+            return
+        with self._attach_lock:
+            if self._buf is not None:
+                return
+            shm = attach_shared_memory()
+            with self._lock:
+                self._shm, self._buf = shm, shm.buf
+                self._rebuild()
+
+    def _header(self, index):
+        return struct.unpack_from("<q", self._buf, index * 8)[0]
+
+    def _set_header(self, index, value):
+        struct.pack_into("<q", self._buf, index * 8, value)
+
+    def _add_header(self, index, delta):
+        self._set_header(index, self._header(index) + delta)
+
+    def _slot_offset(self, slot):
+        return _HEADER.size + slot * _SLOT.size
+
+    def _slot(self, slot):
+        return _SLOT.unpack_from(self._buf, self._slot_offset(slot))
+
+    def _write_candidate(self, candidate_id, name, party, votes):
+        slot = candidate_id - 1
+        name_b, party_b = _encode(name), _encode(party)
+        if not 0 <= slot < CAPACITY or name_b is None or party_b is None:
+            self._set_header(_OVERFLOW, 1)
+            return
+        _SLOT.pack_into(self._buf, self._slot_offset(slot), 1, votes, name_b, party_b)
+
+    def _rebuild(self):
+        """
+        Reconstruye el conteo desde la base de datos. Requiere el bloqueo.
+        """
+        generation = self._header(_GENERATION)
+        self._set_header(_GENERATION, generation | 1)
+        db = SessionLocal()
+        try:
+            candidates = db.query(Candidate.id, Candidate.name, Candidate.party, Candidate.votes).all()
+            registered = db.query(func.count(Voter.id)).scalar()
+            voted = db.query(func.count(Voter.id)).filter(Voter.has_voted == True).scalar()
+        finally:
+            db.close()
+
+        self._buf[_HEADER.size:_SIZE] = bytes(_SIZE - _HEADER.size)
+        self._set_header(_OVERFLOW, 0)
+        self._set_header(_REGISTERED, registered)
+        self._set_header(_VOTED, voted)
+        for c in candidates:
+            self._write_candidate(c.id, c.name, c.party, c.votes or 0)
+        self._set_header(_MAGIC, MAGIC)
+        self._set_header(_GENERATION, (generation | 1) + 1)
+
+    def _needs_rebuild(self):
+        return self._header(_MAGIC) != MAGIC or self._header(_GENERATION) % 2
+
+    @contextmanager
+    def update(self):
+        """
+        Abre una actualización exclusiva del conteo.
+
+        Si el bloque dentro del contexto lanza una excepción la generación
+        queda impar y el conteo se reconstruirá desde la base de datos en el
+        siguiente acceso.
+        """
+        self._attach()
+        with self._lock:
+            if self._needs_rebuild():
+                self._rebuild()
+            generation = self._header(_GENERATION)
+            self._set_header(_GENERATION, generation + 1)
+            yield TallyWriter(self)
+            self._set_header(_GENERATION, generation + 2)
+
+    def _parse(self, data):
+        magic, generation, registered, voted, overflow = _HEADER.unpack_from(data, 0)
+        if overflow:
+            return None
+        candidates = []
+        for slot, (present, votes, name, party) in enumerate(
+                _SLOT.iter_unpack(data[_HEADER.size:_SIZE])):
+            if present:
+                candidates.append({
+                    "id": slot + 1,
+                    "name": name.rstrip(b"\0").decode("utf-8"),
+                    "party": party.rstrip(b"\0").decode("utf-8") or None,
+                    "votes": votes,
+                })
+        return {"candidates": candidates, "registered": registered, "voted": voted}
+
+    def read(self):
+        """
+        Devuelve una copia consistente del conteo sin consultar la base de datos.
+
+        Retorna:
+        - dict con "candidates" (id, name, party, votes), "registered" y "voted",
+          o None si hay desbordamiento y se debe usar la base de datos.
+        """
+        self._attach()
+        delay = _READ_BACKOFF
+        for _ in range(_READ_RETRIES):
+            if self._header(_MAGIC) != MAGIC:
+                break
+            before = self._header(_GENERATION)
+            if not before % 2:
+                data = bytes(self._buf[:_SIZE])
+                if self._header(_GENERATION) == before:
+                    return self._parse(data)
+            time.sleep(delay)
+            delay = min(delay * 2, _READ_BACKOFF_MAX)
+        # Escritura interrumpida (o muy lenta): esperar al bloqueo y reparar si hace falta.
+        with self._lock:
+            if self._needs_rebuild():
+                self._rebuild()
+            return self._parse(bytes(self._buf[:_SIZE]))
+
+    def unlink(self):
+        """Elimina el bloque compartido (solo para mantenimiento o pruebas)."""
+        self._attach()
+        try:
+            from multiprocessing import resource_tracker
+            # unlink() lo desregistra; volver a registrarlo evita avisos del tracker.
+            resource_tracker.register(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = self._buf = None
+
+
+tally = SharedTally()